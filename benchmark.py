@@ -0,0 +1,210 @@
+# benchmark.py
+"""Load benchmark for the cards API.
+
+Seeds a fresh SQLite file, starts uvicorn against it and drives each
+scenario at a fixed concurrency, reporting p50/p99 latency and requests
+per second. Run from the repository root:
+
+    python benchmark.py --concurrency 16 --duration 10 --cards 10000
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from pagination import encode_cursor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EMAIL = "bench@example.com"
+PASSWORD = "bench-password"
+
+
+def seed(database_url, cards):
+    # models reads DATABASE_URL at import, so import it only once it's set
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, HERE)
+    from sqlalchemy import insert
+
+    import search
+    from models import Card, SessionLocal, engine
+
+    search.install(engine)
+    db = SessionLocal()
+    try:
+        rows = [{"title": f"Bench card {i}", "image": f"Image {i}"} for i in range(cards)]
+        for start in range(0, len(rows), 5000):
+            db.execute(insert(Card), rows[start:start + 5000])
+        db.commit()
+    finally:
+        db.close()
+    engine.dispose()
+
+
+def start_server(database_url, port, workers):
+    # WEB_CONCURRENCY lets each worker size its bcrypt pool to its share of cores
+    env = dict(os.environ, DATABASE_URL=database_url, WEB_CONCURRENCY=str(workers))
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=HERE,
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit("uvicorn exited during startup")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    sys.exit("uvicorn did not start within 30s")
+
+
+def request(conn, method, path, body=None):
+    headers = {}
+    if body is not None:
+        body = json.dumps(body)
+        headers["Content-Type"] = "application/json"
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def scenarios(cards):
+    # Each scenario returns the (method, path, body) of its next request
+    delete_ids = itertools.count(1)
+    lock = threading.Lock()
+
+    def next_delete_id():
+        with lock:
+            return next(delete_ids)
+
+    card_body = {"title": "Bench card", "image": "Image"}
+    return {
+        "list": lambda: ("GET", "/cards/?skip=%d&limit=20" % random.randrange(cards), None),
+        # Keyset pages start at a random depth, like "list" does with skip
+        "list_cursor": lambda: (
+            "GET", "/cards/?after=%s&limit=20" % encode_cursor(random.randrange(cards)), None
+        ),
+        "read": lambda: ("GET", "/cards/%d" % random.randint(1, cards), None),
+        "create": lambda: ("POST", "/cards/", card_body),
+        "update": lambda: ("PUT", "/cards/%d" % random.randint(1, cards), card_body),
+        "delete": lambda: ("DELETE", "/cards/%d" % next_delete_id(), None),
+        "token": lambda: ("POST", "/token", {"email": EMAIL, "password": PASSWORD}),
+    }
+
+
+def run_scenario(port, make_request, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        local = []
+        local_errors = 0
+        while True:
+            if time.monotonic() >= deadline:
+                break
+            method, path, body = make_request()
+            started = time.perf_counter()
+            try:
+                status = request(conn, method, path, body)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                status = None
+            local.append(time.perf_counter() - started)
+            if status is None or status >= 400:
+                local_errors += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100)
+        p50, p99 = cuts[49], cuts[98]
+    else:
+        p50 = p99 = latencies[0] if latencies else 0.0
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / elapsed,
+        "p50_ms": p50 * 1000,
+        "p99_ms": p99 * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--cards", type=int, default=10000, help="cards to seed")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for request mix")
+    parser.add_argument("--only", nargs="*", help="scenarios to run (default: all)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    all_scenarios = scenarios(args.cards)
+    names = args.only or list(all_scenarios)
+    unknown = set(names) - set(all_scenarios)
+    if unknown:
+        parser.error("unknown scenarios: %s" % ", ".join(sorted(unknown)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = "sqlite:///" + os.path.join(tmp, "bench.db")
+        seed(database_url, args.cards)
+        server = start_server(database_url, args.port, args.workers)
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", args.port, timeout=30)
+            request(conn, "POST", "/users/", {"email": EMAIL, "password": PASSWORD})
+            conn.close()
+            results = {}
+            for name in names:
+                results[name] = run_scenario(
+                    args.port, all_scenarios[name], args.concurrency, args.duration
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print("%-12s %9s %7s %10s %9s %9s" % ("scenario", "requests", "errors", "req/s", "p50 ms", "p99 ms"))
+    for name, r in results.items():
+        print("%-12s %9d %7d %10.1f %9.2f %9.2f" % (
+            name, r["requests"], r["errors"], r["rps"], r["p50_ms"], r["p99_ms"]
+        ))
+
+
+if __name__ == "__main__":
+    main()
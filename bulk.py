@@ -0,0 +1,218 @@
+# bulk.py
+import codecs
+import json
+import re
+import tempfile
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Card
+
+CHUNK_SIZE = 500
+MAX_ITEM_BYTES = 1024 * 1024
+# Result lines stay in memory up to this size, then spill to a temp file
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def _too_large():
+    return HTTPException(status_code=413, detail="Bulk item too large")
+
+
+def _parse_line(line):
+    # A bad line only fails its own item, so it is yielded as the error
+    try:
+        return json.loads(line)
+    except ValueError as exc:
+        return exc
+
+
+async def _iter_ndjson(request: Request):
+    buf = b""
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+        if len(buf) > MAX_ITEM_BYTES:
+            raise _too_large()
+    if buf.strip():
+        yield _parse_line(buf)
+
+
+def _maybe_truncated(exc, buf):
+    # A decode error right at the end of the buffer, or inside a string or
+    # a short literal/escape that may continue, can be fixed by more input.
+    # Anything else is a syntax error that more input won't fix.
+    return exc.msg.startswith("Unterminated string") or len(buf) - exc.pos <= 6
+
+
+def _number_may_continue(item, buf, end):
+    # "-1." or "1e" at the end of the buffer decode as a shorter number and
+    # leave at most two characters unread; more input may extend them
+    return (
+        isinstance(item, (int, float))
+        and not isinstance(item, bool)
+        and len(buf) - end <= 2
+        and (end == len(buf) or buf[end] not in " \t\n\r,]")
+    )
+
+
+# _iter_json_array states
+_START, _FIRST, _VALUE, _SEPARATOR, _AFTER = range(5)
+
+
+async def _iter_json_array(request: Request):
+    # Decode one element at a time from a growing buffer instead of loading
+    # the whole document, so memory is bounded by the largest single item.
+    # idx is the read offset; consumed text is only dropped when refilling,
+    # so a large received chunk is never re-copied once per item.
+    stream = request.stream()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    idx = 0
+    done = False
+    state = _START
+
+    async def fill():
+        nonlocal buf, idx, done
+        try:
+            data = text.decode(await stream.__anext__())
+        except StopAsyncIteration:
+            data = text.decode(b"", final=True)
+            done = True
+        buf = buf[idx:] + data
+        idx = 0
+
+    while True:
+        idx = _WHITESPACE.match(buf, idx).end()
+        if idx == len(buf):
+            if not done:
+                await fill()
+            elif state == _AFTER:
+                return
+            elif state == _START:
+                raise ValueError("Expected a JSON array")
+            else:
+                raise ValueError("Truncated JSON array")
+            continue
+        char = buf[idx]
+        if state == _START:
+            if char != "[":
+                raise ValueError("Expected a JSON array")
+            idx += 1
+            state = _FIRST
+        elif state == _SEPARATOR:
+            if char not in ",]":
+                raise ValueError(f"Expected ',' or ']', got {char!r}")
+            idx += 1
+            state = _VALUE if char == "," else _AFTER
+        elif state == _AFTER:
+            raise ValueError("Unexpected data after the JSON array")
+        elif state == _FIRST and char == "]":
+            idx += 1
+            state = _AFTER
+        else:
+            try:
+                item, end = _decoder.raw_decode(buf, idx)
+            except json.JSONDecodeError as exc:
+                if done or not _maybe_truncated(exc, buf):
+                    raise
+                item, end = None, None
+            if end is None or (not done and _number_may_continue(item, buf, end)):
+                if len(buf) - idx > MAX_ITEM_BYTES:
+                    raise _too_large()
+                await fill()
+                continue
+            idx = end
+            state = _SEPARATOR
+            yield item
+
+
+def iter_items(request: Request):
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        return _iter_ndjson(request)
+    return _iter_json_array(request)
+
+
+async def iter_chunks(items, size: int = CHUNK_SIZE):
+    chunk = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _describe(exc):
+    if isinstance(exc, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in exc.errors()
+        )
+    return str(exc)
+
+
+def validate(chunk, start: int, parse):
+    """Split a chunk into parsed items and per-item error results."""
+    valid, errors = [], []
+    for index, item in enumerate(chunk, start):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            valid.append((index, parse(item)))
+        except (TypeError, ValueError) as exc:
+            errors.append({"index": index, "id": None, "error": _describe(exc)})
+    return valid, errors
+
+
+def open_spool():
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, mode="w+b")
+
+
+def spool_results(spool, results):
+    spool.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in results).encode())
+
+
+def iter_spool(spool, size: int = 64 * 1024):
+    try:
+        spool.seek(0)
+        while True:
+            data = spool.read(size)
+            if not data:
+                return
+            yield data
+    finally:
+        spool.close()
+
+
+def create_cards(db: Session, rows):
+    stmt = insert(Card).returning(Card.id, sort_by_parameter_order=True)
+    ids = db.scalars(stmt, rows).all()
+    db.commit()
+    return ids
+
+
+def update_cards(db: Session, rows):
+    found = set(db.scalars(select(Card.id).where(Card.id.in_([r["id"] for r in rows]))))
+    existing = [r for r in rows if r["id"] in found]
+    if existing:
+        db.execute(update(Card), existing)
+    db.commit()
+    return found
+
+
+def delete_cards(db: Session, ids):
+    found = set(db.scalars(select(Card.id).where(Card.id.in_(ids))))
+    if found:
+        db.execute(delete(Card).where(Card.id.in_(found)))
+    db.commit()
+    return found
@@ -0,0 +1,98 @@
+# cache.py
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+CARD_CACHE_SIZE = int(os.environ.get("CARD_CACHE_SIZE", 1024))
+CARD_CACHE_TTL = float(os.environ.get("CARD_CACHE_TTL", 30))
+
+# The cards version lives in the database, bumped by triggers in the same
+# transaction as the write, so every worker process sees the same value no
+# matter which one handled the write.
+VERSION_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS table_versions (
+        name VARCHAR PRIMARY KEY, version INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('cards', 0)",
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cards_version_{op.lower()} AFTER {op} ON cards BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = 'cards';
+    END
+    """
+    for op in ("INSERT", "UPDATE", "DELETE")
+]
+
+
+def install(engine):
+    with engine.begin() as conn:
+        for ddl in VERSION_DDL:
+            conn.execute(text(ddl))
+
+
+def cards_version(db):
+    return db.execute(text("SELECT version FROM table_versions WHERE name = 'cards'")).scalar_one()
+
+
+class ResponseCache:
+    """Bounded LRU of serialized JSON bodies with a TTL and ETags.
+
+    Callers put the current ``cards_version`` in every key, so a write in
+    any process retires all earlier entries; they simply age out of the LRU.
+    """
+
+    def __init__(self, maxsize: int = CARD_CACHE_SIZE, ttl: float = CARD_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def set(self, key, body: bytes):
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        with self._lock:
+            if self.maxsize > 0:
+                self._entries[key] = (time.monotonic() + self.ttl, body, etag)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return body, etag
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+card_cache = ResponseCache()
@@ -0,0 +1,54 @@
+# export.py
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from models import Card, ReadSessionLocal
+
+PARTITION_SIZE = 1000
+
+
+def iter_partitions(since_id: int = 0, size: int = PARTITION_SIZE):
+    # Each partition is a short keyset query in its own session, so no read
+    # transaction stays open while the client drains the response.
+    last_id = since_id
+    while True:
+        db = ReadSessionLocal()
+        try:
+            stmt = (
+                select(Card.id, Card.title, Card.image)
+                .where(Card.id > last_id)
+                .order_by(Card.id)
+                .limit(size)
+            )
+            rows = db.execute(stmt).all()
+        finally:
+            db.close()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < size:
+            return
+        last_id = rows[-1].id
+
+
+def ndjson_rows(since_id: int = 0):
+    for rows in iter_partitions(since_id):
+        yield "".join(
+            json.dumps({"id": r.id, "title": r.title, "image": r.image}) + "\n" for r in rows
+        ).encode()
+
+
+def csv_rows(since_id: int = 0):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["id", "title", "image"])
+    for rows in iter_partitions(since_id):
+        writer.writerows(rows)
+        yield out.getvalue().encode()
+        out.seek(0)
+        out.truncate()
+    if out.tell():
+        yield out.getvalue().encode()
@@ -0,0 +1,134 @@
+# hashing.py
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+# Every uvicorn worker process starts its own pool, so by default the cores
+# are split between them: uvicorn reads --workers from WEB_CONCURRENCY too.
+# Set HASH_WORKERS so that HASH_WORKERS * web workers <= cores.
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+HASH_WORKERS = int(
+    os.environ.get("HASH_WORKERS", max((os.cpu_count() or 1) // WEB_CONCURRENCY, 1))
+)
+HASH_QUEUE_SIZE = int(os.environ.get("HASH_QUEUE_SIZE", 64))
+HASH_RETRY_AFTER = int(os.environ.get("HASH_RETRY_AFTER", 1))
+
+logger = logging.getLogger(__name__)
+
+# Password hashing
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class HashingService:
+    """Runs bcrypt in worker processes so it never holds the server's GIL.
+
+    At most ``workers`` jobs run at once and ``queue_size`` more may wait;
+    anything beyond that is rejected with a 503 instead of queueing.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_size: int = HASH_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pool = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def _new_pool(self):
+        # spawn keeps the workers free of the server's threads and connections
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def start(self):
+        self.pool = self._new_pool()
+
+    def _restart(self, broken):
+        # Concurrent jobs all see the same broken pool; replace it only once
+        if self.pool is broken:
+            logger.warning("Hashing pool worker died, starting a new pool")
+            self.pool = self._new_pool()
+            self.restarts += 1
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def _overloaded(self):
+        return HTTPException(
+            status_code=503,
+            detail="Password hashing is overloaded, try again shortly",
+            headers={"Retry-After": str(HASH_RETRY_AFTER)},
+        )
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    async def _run(self, fn, *args):
+        # in_flight is only touched on the event loop thread, so no lock
+        if self.in_flight >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise self._overloaded()
+        if self.pool is None:
+            self.start()
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await self._submit(fn, *args)
+        finally:
+            self.in_flight -= 1
+            elapsed = time.perf_counter() - started
+            self.completed += 1
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+
+    async def _submit(self, fn, *args):
+        # A worker killed mid-job (OOM, segfault) breaks the whole executor;
+        # swap in a fresh pool and retry once, since hashing is idempotent.
+        loop = asyncio.get_running_loop()
+        for _ in range(2):
+            pool = self.pool
+            try:
+                return await loop.run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                self._restart(pool)
+        raise self._overloaded()
+
+    async def hash(self, password):
+        return await self._run(_hash, password)
+
+    async def verify(self, plain_password, hashed_password):
+        return await self._run(_verify, plain_password, hashed_password)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "queue_depth": max(self.in_flight - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "latency_avg_ms": self.latency_total / self.completed * 1000 if self.completed else 0.0,
+            "latency_max_ms": self.latency_max * 1000,
+        }
+
+
+hasher = HashingService()
@@ -0,0 +1,219 @@
+# images.py
+import argparse
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+import anyio
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import FileResponse
+
+IMAGE_STORE_DIR = os.environ.get("IMAGE_STORE_DIR", "./images")
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", 20 * 1024 * 1024))
+IMAGE_GC_GRACE = int(os.environ.get("IMAGE_GC_GRACE", 3600))
+
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+MAGIC = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+# Enough leading bytes to recognise every format above and WebP
+SNIFF_BYTES = 12
+
+
+def is_digest(value):
+    return isinstance(value, str) and DIGEST_RE.match(value) is not None
+
+
+def blob_path(digest: str):
+    # Fan out on the first two hex digits to keep directories small
+    return os.path.join(IMAGE_STORE_DIR, digest[:2], digest)
+
+
+def _tmp_dir():
+    path = os.path.join(IMAGE_STORE_DIR, "tmp")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+async def store_stream(stream):
+    """Write an upload to the store, hashing it as it streams in.
+
+    The blob lands in a temp file in the store and is renamed to its digest,
+    so readers never see a partial file. Content already in the store is not
+    written twice.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    tmp = tempfile.NamedTemporaryFile(dir=_tmp_dir(), delete=False)
+    try:
+        with tmp:
+            async for chunk in stream:
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail="Image too large")
+                # Reject non-images as soon as the magic bytes are in
+                if len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                    if len(head) == SNIFF_BYTES:
+                        _check_image(head)
+                digest.update(chunk)
+                await run_in_threadpool(tmp.write, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty image")
+        if len(head) < SNIFF_BYTES:
+            _check_image(head)
+        hexdigest = digest.hexdigest()
+        path = blob_path(hexdigest)
+        if os.path.exists(path):
+            # Refresh mtime so a concurrent gc keeps it through its grace period
+            os.utime(path)
+            os.unlink(tmp.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp.name, path)
+    except BaseException:
+        if os.path.exists(tmp.name):
+            os.unlink(tmp.name)
+        raise
+    return hexdigest, size
+
+
+def _sniff_media_type(head: bytes):
+    """Media type of an image from its first SNIFF_BYTES bytes, or None."""
+    for magic, media_type in MAGIC:
+        if head.startswith(magic):
+            return media_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def _check_image(head):
+    if _sniff_media_type(head) is None:
+        raise HTTPException(
+            status_code=415, detail="Unsupported image type, expected PNG, JPEG, GIF or WebP"
+        )
+
+
+def _media_type(path):
+    # Blobs stored before uploads were checked may not be images
+    with open(path, "rb") as f:
+        return _sniff_media_type(f.read(SNIFF_BYTES)) or "application/octet-stream"
+
+
+def _parse_range(header, size):
+    # Only a single range is honoured; anything else gets the full body
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        # An inverted range is syntactically invalid, so it is ignored
+        if end and int(end) < int(start):
+            return None
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        raise HTTPException(
+            status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+class BlobResponse(FileResponse):
+    """FileResponse that can also answer a single byte range with a 206."""
+
+    def __init__(self, path, byte_range=None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.byte_range = byte_range
+        if byte_range is not None:
+            start, end = byte_range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{self.stat_result.st_size}"
+            self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope, receive, send):
+        if self.byte_range is None:
+            await super().__call__(scope, receive, send)
+            return
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if scope["method"].upper() != "HEAD":
+            start, end = self.byte_range
+            remaining = end - start + 1
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(start)
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def blob_response(digest: str, range_header=None):
+    if not is_digest(digest):
+        raise HTTPException(status_code=404, detail="Image not found")
+    path = blob_path(digest)
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    byte_range = _parse_range(range_header, stat_result.st_size) if range_header else None
+    return BlobResponse(
+        path,
+        byte_range=byte_range,
+        stat_result=stat_result,
+        media_type=_media_type(path),
+        headers={"ETag": f'"{digest}"', "Cache-Control": IMMUTABLE, "Accept-Ranges": "bytes"},
+    )
+
+
+def collect_garbage(referenced, grace: int = IMAGE_GC_GRACE):
+    """Delete blobs no card references, skipping anything newer than grace."""
+    cutoff = time.time() - grace
+    removed = 0
+    if not os.path.isdir(IMAGE_STORE_DIR):
+        return removed
+    for root, _, files in os.walk(IMAGE_STORE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            in_tmp = os.path.basename(root) == "tmp"
+            if not in_tmp and name in referenced:
+                continue
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Image store maintenance")
+    parser.add_argument("command", choices=["gc"])
+    parser.add_argument("--grace", type=int, default=IMAGE_GC_GRACE,
+                        help="keep unreferenced blobs younger than this many seconds")
+    args = parser.parse_args()
+
+    from sqlalchemy import select
+
+    from models import Card, ReadSessionLocal
+
+    db = ReadSessionLocal()
+    try:
+        referenced = {image for image in db.scalars(select(Card.image)) if is_digest(image)}
+    finally:
+        db.close()
+    print("removed %d unreferenced blobs" % collect_garbage(referenced, args.grace))
@@ -1,18 +1,35 @@
 import os
-from fastapi import FastAPI, Depends, HTTPException
+import json
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, tuple_, union_all
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Union
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from passlib.context import CryptContext
+from fastapi.responses import HTMLResponse, StreamingResponse
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 
-from models import Base, Card, SessionLocal, engine
+from models import Base, Card, CardStats, User, ReadSessionLocal, SessionLocal, engine, read_engine
+from hashing import hasher
+import swipes
+from swipes import swipe_writer
+from pagination import decode_cursor, encode_cursor
+import cache
+from cache import card_cache, etag_matches
+import bulk
+import export
+import images
+import metrics
+import search
 import schemas
 
 # Create all tables
 Base.metadata.create_all(bind=engine)
+search.install(engine)
+cache.install(engine)
+swipes.install(engine)
 
 app = FastAPI()
 
@@ -23,10 +40,27 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.instrument_engine(engine)
+if read_engine is not engine:
+    metrics.instrument_engine(read_engine)
 
 # Dependency
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    # Safe methods read from the read-only pool; everything else gets the
+    # single writer connection.
+    if request.method in ("GET", "HEAD"):
+        db = ReadSessionLocal()
+    else:
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
@@ -50,15 +84,20 @@ def startup_event():
     db = SessionLocal()
     add_default_cards(db)
     db.close()
+    hasher.start()
+    swipe_writer.start()
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@app.on_event("shutdown")
+def shutdown_event():
+    hasher.shutdown()
+    swipe_writer.stop()
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# Password hashing runs in a separate process pool (see hashing.py)
+async def get_password_hash(password):
+    return await hasher.hash(password)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await hasher.verify(plain_password, hashed_password)
 
 # JWT settings
 SECRET_KEY = "your_secret_key"
@@ -75,22 +114,41 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def get_user_by_email(db: Session, email: str):
+    return db.query(User).filter(User.email == email).first()
+
+def save_user(db: Session, db_user: User):
+    # The email check runs before the slow hash, so a concurrent signup for
+    # the same address can win the race; the unique index catches it here.
+    db.add(db_user)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Email already registered")
+    db.refresh(db_user)
+    return db_user
+
+# These endpoints are async so that waiting on the hashing pool doesn't hold
+# one of the shared threadpool slots; the quick DB calls still go through it.
 @app.post("/users/", response_model=schemas.UserResponse)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def create_user(
+    user: schemas.UserCreate,
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
+):
+    # Look up on a reader so the writer isn't held while the password hashes
+    db_user = await run_in_threadpool(get_user_by_email, read_db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(email=user.email, hashed_password=hashed_password)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    return await run_in_threadpool(save_user, db, db_user)
 
 @app.post("/token", response_model=dict)
-def login_for_access_token(form_data: schemas.UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form_data.email).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: schemas.UserLogin, db: Session = Depends(get_read_db)):
+    user = await run_in_threadpool(get_user_by_email, db, form_data.email)
+    if not user or not await verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -102,6 +160,41 @@ def login_for_access_token(form_data: schemas.UserLogin, db: Session = Depends(g
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+@app.get("/stats/hashing")
+def hashing_stats():
+    return hasher.stats()
+
+@app.get("/stats/swipes")
+def swipe_stats():
+    return swipe_writer.stats()
+
+@app.get("/stats/cache")
+def cache_stats():
+    return card_cache.stats()
+
+@app.post("/images", status_code=201)
+async def upload_image(request: Request):
+    # The raw request body is the image; it is never held in memory whole
+    digest, size = await images.store_stream(request.stream())
+    return {"digest": digest, "size": size, "url": f"/images/{digest}"}
+
+@app.get("/images/{digest}")
+def read_image(digest: str, request: Request):
+    etag = f'"{digest}"'
+    if etag_matches(request.headers.get("if-none-match"), etag) and images.is_digest(digest) \
+            and os.path.exists(images.blob_path(digest)):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": images.IMMUTABLE})
+    return images.blob_response(digest, request.headers.get("range"))
+
+@app.get("/metrics")
+def read_metrics():
+    body = metrics.render({
+        "hashing": hasher.stats(),
+        "card_cache": card_cache.stats(),
+        "swipes": swipe_writer.stats(),
+    })
+    return Response(content=body, media_type="text/plain; version=0.0.4")
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
     html_content = """
@@ -126,17 +219,272 @@ def create_card(card: schemas.CardCreate, db: Session = Depends(get_db)):
     db.refresh(db_card)
     return db_card
 
-@app.get("/cards/", response_model=List[schemas.Card])
-def read_cards(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    cards = db.query(Card).offset(skip).limit(limit).all()
-    return cards
+def dump_json(data):
+    return json.dumps(data, separators=(",", ":")).encode()
+
+def card_dict(row):
+    return {"title": row.title, "image": row.image, "id": row.id}
+
+def cached_json(request: Request, db: Session, key, load):
+    # Read the version before loading: a write landing mid-load can only make
+    # the body newer than its key, never older.
+    key = (cache.cards_version(db),) + key
+    entry = card_cache.get(key)
+    if entry is None:
+        entry = card_cache.set(key, load())
+    body, etag = entry
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+def card_page_query(after: str, sort: str, limit: int):
+    # Fetch one extra row to know whether another page exists
+    limit += 1
+    stmt = select(Card.id, Card.title, Card.image)
+    if sort != "title":
+        stmt = stmt.order_by(Card.id)
+        if after:
+            (card_id,) = decode_cursor(after, int)
+            stmt = stmt.where(Card.id > card_id)
+        return stmt.limit(limit)
+    # ix_cards_title stores (title, rowid); the row-value comparison lets
+    # SQLite seek straight to the cursor instead of scanning the index.
+    stmt = stmt.order_by(Card.title, Card.id)
+    if not after:
+        return stmt.limit(limit)
+    title, card_id = decode_cursor(after, (str, type(None)), int)
+    if title is not None:
+        return stmt.where(tuple_(Card.title, Card.id) > tuple_(title, card_id)).limit(limit)
+    # NULL titles sort first and can't take part in a row-value comparison,
+    # so seek the rest of the NULL run and the start of the titled rows
+    # separately and merge the two short results.
+    nulls = (
+        select(Card.id, Card.title, Card.image)
+        .where(Card.title.is_(None), Card.id > card_id)
+        .order_by(Card.id)
+        .limit(limit)
+        .subquery()
+    )
+    titled = stmt.where(Card.title.is_not(None)).limit(limit).subquery()
+    merged = union_all(select(nulls), select(titled)).subquery()
+    return (
+        select(merged.c.id, merged.c.title, merged.c.image)
+        .order_by(merged.c.title, merged.c.id)
+        .limit(limit)
+    )
+
+# Largest cursor page; skip/limit keeps accepting any limit, as it always has
+MAX_PAGE_SIZE = 1000
+
+@app.get("/cards/", response_model=Union[List[schemas.Card], schemas.CardPage])
+def read_cards(
+    request: Request,
+    skip: int = 0,
+    limit: int = 10,
+    after: Optional[str] = None,
+    sort: str = Query("id", pattern="^(id|title)$"),
+    db: Session = Depends(get_db),
+):
+    # Pages are cached under the cards version, so any write retires them
+    if after is None:
+        def load():
+            stmt = select(Card.id, Card.title, Card.image)
+            if sort == "title":
+                stmt = stmt.order_by(Card.title, Card.id)
+            stmt = stmt.offset(skip).limit(limit)
+            return dump_json([card_dict(r) for r in db.execute(stmt)])
+
+        return cached_json(request, db, ("cards", skip, limit, sort), load)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=422, detail=f"limit must be between 1 and {MAX_PAGE_SIZE} with a cursor"
+        )
+    # Cursor mode: ?after= (empty) starts at the first page. Rows are read as
+    # plain tuples and serialized directly, skipping ORM and pydantic objects.
+    stmt = card_page_query(after, sort, limit)
+
+    def load():
+        rows = db.execute(stmt).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last.title, last.id) if sort == "title" else encode_cursor(last.id)
+        return dump_json({"items": [card_dict(r) for r in rows], "next_cursor": next_cursor})
+
+    return cached_json(request, db, ("cards", after, sort, limit), load)
+
+def _card_item(item):
+    if not isinstance(item, dict):
+        raise TypeError("Expected a card object")
+    return item
+
+def _card_id(item):
+    if isinstance(item, dict):
+        item = item.get("id")
+    if not isinstance(item, int) or isinstance(item, bool):
+        raise TypeError("Expected a card id")
+    return item
+
+# Each line of a bulk response is one BulkItemResult, in input order. If the
+# body turns out to be malformed after some chunks were committed, the last
+# line is an error result whose index is the first item that was not applied.
+BULK_RESPONSES = {200: {"model": schemas.BulkItemResult, "content": {"application/x-ndjson": {}}}}
+
+async def run_bulk(request: Request, parse, write):
+    # Items are validated and written one chunk at a time; each chunk is its
+    # own transaction, so earlier chunks stay committed if a later one fails.
+    # Results are spooled per chunk and streamed back once the body has been
+    # read (StreamingResponse listens on receive() while it sends, so the
+    # body can't be read from inside the response).
+    spool = bulk.open_spool()
+    start = 0
+    try:
+        async for chunk in bulk.iter_chunks(bulk.iter_items(request)):
+            valid, results = bulk.validate(chunk, start, parse)
+            start += len(chunk)
+            if valid:
+                results += await run_in_threadpool(write, valid)
+            results.sort(key=lambda r: r["index"])
+            await run_in_threadpool(bulk.spool_results, spool, results)
+    except ValueError as exc:
+        if start == 0:
+            spool.close()
+            raise HTTPException(status_code=400, detail=f"Malformed bulk body: {exc}")
+        # Earlier chunks are already committed, so their results are still
+        # sent; a bare 400 would hide which items were applied
+        error = f"Malformed bulk body, items from {start} on were not applied: {exc}"
+        await run_in_threadpool(
+            bulk.spool_results, spool, [{"index": start, "id": None, "error": error}]
+        )
+    except BaseException:
+        spool.close()
+        raise
+    return StreamingResponse(bulk.iter_spool(spool), media_type="application/x-ndjson")
+
+@app.post("/cards/bulk", responses=BULK_RESPONSES)
+async def create_cards_bulk(request: Request, db: Session = Depends(get_db)):
+    def write(valid):
+        ids = bulk.create_cards(db, [card.dict() for _, card in valid])
+        return [
+            {"index": index, "id": card_id, "error": None}
+            for (index, _), card_id in zip(valid, ids)
+        ]
+
+    def parse(item):
+        return schemas.CardCreate(**_card_item(item))
+
+    return await run_bulk(request, parse, write)
+
+@app.put("/cards/bulk", responses=BULK_RESPONSES)
+async def update_cards_bulk(request: Request, db: Session = Depends(get_db)):
+    def write(valid):
+        found = bulk.update_cards(db, [card.dict() for _, card in valid])
+        return [
+            {"index": index, "id": card.id, "error": None if card.id in found else "Card not found"}
+            for index, card in valid
+        ]
+
+    def parse(item):
+        return schemas.CardBulkUpdate(**_card_item(item))
+
+    return await run_bulk(request, parse, write)
+
+@app.delete("/cards/bulk", responses=BULK_RESPONSES)
+async def delete_cards_bulk(request: Request, db: Session = Depends(get_db)):
+    def write(valid):
+        found = bulk.delete_cards(db, [card_id for _, card_id in valid])
+        return [
+            {"index": index, "id": card_id, "error": None if card_id in found else "Card not found"}
+            for index, card_id in valid
+        ]
+
+    return await run_bulk(request, _card_id, write)
+
+EXPORT_FORMATS = {
+    "ndjson": (export.ndjson_rows, "application/x-ndjson"),
+    "csv": (export.csv_rows, "text/csv"),
+}
+
+@app.get("/cards/export")
+def export_cards(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), since_id: int = 0):
+    rows, media_type = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        rows(since_id),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="cards.{format}"'},
+    )
+
+@app.get("/cards/search", response_model=schemas.CardPage)
+def search_cards(
+    request: Request,
+    q: str,
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    match = search.match_expression(q)
+
+    def load():
+        if match is None:
+            return dump_json({"items": [], "next_cursor": None})
+        stmt, params = search.search_query(match, limit + 1, after)
+        rows = db.execute(stmt, params).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = search.next_cursor(rows[-1])
+        return dump_json({"items": [card_dict(r) for r in rows], "next_cursor": next_cursor})
+
+    # Ranked by bm25 (FTS5's default rank), keyset-paginated on (rank, id)
+    return cached_json(request, db, ("search", match, after, limit), load)
 
 @app.get("/cards/{card_id}", response_model=schemas.Card)
-def read_card(card_id: int, db: Session = Depends(get_db)):
-    card = db.query(Card).filter(Card.id == card_id).first()
-    if card is None:
-        raise HTTPException(status_code=404, detail="Card not found")
-    return card
+def read_card(request: Request, card_id: int, db: Session = Depends(get_db)):
+    def load():
+        row = db.execute(select(Card.id, Card.title, Card.image).where(Card.id == card_id)).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Card not found")
+        return dump_json(card_dict(row))
+
+    return cached_json(request, db, ("card", card_id), load)
+
+@app.get("/cards/{card_id}/stats", response_model=schemas.CardStats)
+def read_card_stats(card_id: int, db: Session = Depends(get_db)):
+    # Counters are maintained by the swipe writer, so this is a primary key read
+    stats = db.get(CardStats, card_id)
+    if stats is None:
+        if db.get(Card, card_id) is None:
+            raise HTTPException(status_code=404, detail="Card not found")
+        return {"card_id": card_id, "likes": 0, "dislikes": 0}
+    return stats
+
+@app.post("/swipes", status_code=202)
+def create_swipes(swipes: Union[List[schemas.SwipeCreate], schemas.SwipeCreate]):
+    if not isinstance(swipes, list):
+        swipes = [swipes]
+    now = datetime.utcnow()
+    swipe_writer.submit([
+        {"card_id": s.card_id, "direction": s.direction, "created_at": now} for s in swipes
+    ])
+    return {"accepted": len(swipes)}
+
+@app.put("/cards/{card_id}/image", response_model=schemas.Card)
+async def upload_card_image(card_id: int, request: Request, db: Session = Depends(get_db)):
+    # Store the blob before touching the card so the writer isn't held for
+    # the upload; a blob left behind by a 404 is removed by images.py gc.
+    digest, _ = await images.store_stream(request.stream())
+
+    def save():
+        db_card = db.get(Card, card_id)
+        if db_card is None:
+            raise HTTPException(status_code=404, detail="Card not found")
+        db_card.image = digest
+        db.commit()
+        db.refresh(db_card)
+        return db_card
+
+    return await run_in_threadpool(save)
 
 @app.put("/cards/{card_id}", response_model=schemas.Card)
 def update_card(card_id: int, card: schemas.CardCreate, db: Session = Depends(get_db)):
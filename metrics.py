@@ -0,0 +1,180 @@
+# metrics.py
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# Requests slower than this are logged with the SQL they ran (0 disables)
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 0))
+SLOW_REQUEST_MAX_STATEMENTS = 50
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# stats() fields that only ever go up; exported as counters, not gauges
+COUNTERS = {
+    "completed", "rejected", "restarts", "hits", "misses",
+    "accepted", "written", "batches", "failed", "unknown",
+}
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    def __init__(self):
+        self.sql_count = 0
+        self.db_time = 0.0
+        self.statements = []
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+# Set per request by MetricsMiddleware. anyio copies the context into the
+# threadpool, so the cursor hooks see the same object as the middleware.
+_current = ContextVar("request_stats", default=None)
+
+# (method, route, status) -> Histogram, (method, route) -> [statements, seconds]
+request_latency = {}
+request_sql = {}
+
+
+# The start time lives on the execution context, which is discarded with the
+# statement, so a statement that raises leaves nothing behind on the pooled
+# connection.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_start
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.sql_count += 1
+    stats.db_time += elapsed
+    if SLOW_REQUEST_MS and len(stats.statements) < SLOW_REQUEST_MAX_STATEMENTS:
+        stats.statements.append((elapsed, statement))
+
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            # Label by route template so /cards/1 and /cards/2 share a series
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            self.record(scope["method"], path, status[0], elapsed, stats)
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                log_slow_request(scope, status[0], elapsed, stats)
+
+    @staticmethod
+    def record(method, path, status, elapsed, stats):
+        key = (method, path, str(status))
+        if key not in request_latency:
+            request_latency[key] = Histogram()
+        request_latency[key].observe(elapsed)
+        totals = request_sql.setdefault((method, path), [0, 0.0])
+        totals[0] += stats.sql_count
+        totals[1] += stats.db_time
+
+
+def log_slow_request(scope, status, elapsed, stats):
+    lines = [
+        "%.1fms %s" % (seconds * 1000, " ".join(statement.split()))
+        for seconds, statement in stats.statements
+    ]
+    logger.warning(
+        "Slow request %s %s -> %s in %.1fms (%d SQL statements, %.1fms in DB)%s",
+        scope["method"],
+        scope["path"],
+        status,
+        elapsed * 1000,
+        stats.sql_count,
+        stats.db_time * 1000,
+        "".join("\n    " + line for line in lines),
+    )
+
+
+def _labels(**labels):
+    return ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels.items())
+
+
+def render(gauges=None):
+    """Render all metrics in the Prometheus text exposition format.
+
+    Everything here is per process. Run one uvicorn worker per scrape target
+    (scale out with more instances, not ``--workers``); behind a multi-worker
+    server each scrape reaches a random worker and the ``_total`` counters
+    appear to jump back and forth.
+    """
+    out = [
+        "# HELP http_request_duration_seconds Request latency by route.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, path, status), hist in sorted(request_latency.items()):
+        labels = _labels(method=method, route=path, status=status)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, hist.buckets):
+            cumulative += count
+            out.append('http_request_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, cumulative))
+        out.append('http_request_duration_seconds_bucket{%s,le="+Inf"} %d' % (labels, hist.count))
+        out.append("http_request_duration_seconds_sum{%s} %f" % (labels, hist.sum))
+        out.append("http_request_duration_seconds_count{%s} %d" % (labels, hist.count))
+    out.append("# HELP http_request_sql_statements_total SQL statements issued by route.")
+    out.append("# TYPE http_request_sql_statements_total counter")
+    for (method, path), (count, _) in sorted(request_sql.items()):
+        out.append("http_request_sql_statements_total{%s} %d" % (_labels(method=method, route=path), count))
+    out.append("# HELP http_request_db_seconds_total Time spent in SQL by route.")
+    out.append("# TYPE http_request_db_seconds_total counter")
+    for (method, path), (_, seconds) in sorted(request_sql.items()):
+        out.append("http_request_db_seconds_total{%s} %f" % (_labels(method=method, route=path), seconds))
+    # Numeric fields of the service stats() dicts, e.g. hashing_queue_depth;
+    # running totals are counters, everything else is a point-in-time gauge
+    for prefix, stats in (gauges or {}).items():
+        for name, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                if name in COUNTERS:
+                    out.append("# TYPE %s_%s_total counter" % (prefix, name))
+                    out.append("%s_%s_total %s" % (prefix, name, value))
+                else:
+                    out.append("# TYPE %s_%s gauge" % (prefix, name))
+                    out.append("%s_%s %s" % (prefix, name, value))
+    return "\n".join(out) + "\n"
@@ -1,13 +1,87 @@
 # models.py
-from sqlalchemy import Column, Integer, String, create_engine
+import os
+
+from sqlalchemy import Column, DateTime, Integer, String, create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import relationship
+from sqlalchemy.pool import StaticPool
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./test.db")
+
+# SQLite pragmas applied to every new connection. "legacy" keeps SQLite's
+# defaults; "production" switches to WAL so readers never block the writer.
+STORAGE_PROFILES = {
+    "legacy": {},
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+        "busy_timeout": 5000,
+    },
+}
+STORAGE_PROFILE = os.environ.get("STORAGE_PROFILE", "production")
+PRAGMAS = dict(STORAGE_PROFILES[STORAGE_PROFILE])
+for name in ("journal_mode", "synchronous", "mmap_size", "cache_size", "busy_timeout"):
+    if f"SQLITE_{name.upper()}" in os.environ:
+        PRAGMAS[name] = os.environ[f"SQLITE_{name.upper()}"]
+READ_POOL_SIZE = int(os.environ.get("SQLITE_READ_POOL_SIZE", 8))
+
+
+def _apply_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return on_connect
+
+
+def _is_memory(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
 
-DATABASE_URL = "sqlite:///./test.db"
+def _read_only_url(url):
+    # Open the same file through SQLite's URI syntax with mode=ro
+    if _is_memory(url):
+        return None
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return None
+    return url.set(
+        database=f"file:{url.database}",
+        query={**url.query, "mode": "ro", "uri": "true"},
+    )
+
+
+if _is_memory(DATABASE_URL):
+    # An in-memory database only exists on its own connection, so every
+    # thread has to share that one connection
+    engine = create_engine(
+        DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+else:
+    # All writes share one connection per process, so they queue on the pool
+    # instead of racing each other for SQLite's write lock.
+    engine = create_engine(DATABASE_URL, pool_size=1, max_overflow=0)
+event.listen(engine, "connect", _apply_pragmas(PRAGMAS))
+
+_read_url = _read_only_url(DATABASE_URL)
+if _read_url is None:
+    read_engine = engine
+else:
+    read_engine = create_engine(_read_url, pool_size=READ_POOL_SIZE, max_overflow=0)
+    # journal_mode is a property of the file, set by the writer; readers only
+    # need the per-connection settings.
+    read_pragmas = {k: v for k, v in PRAGMAS.items() if k not in ("journal_mode", "synchronous")}
+    read_pragmas["query_only"] = 1
+    event.listen(read_engine, "connect", _apply_pragmas(read_pragmas))
 
-engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 Base = declarative_base()
 
 class Card(Base):
@@ -17,6 +91,21 @@ class Card(Base):
     title = Column(String, index=True)
     image = Column(String)
 
+class Swipe(Base):
+    __tablename__ = "swipes"
+
+    id = Column(Integer, primary_key=True)
+    card_id = Column(Integer, index=True)
+    direction = Column(String)
+    created_at = Column(DateTime)
+
+class CardStats(Base):
+    __tablename__ = "card_stats"
+
+    card_id = Column(Integer, primary_key=True)
+    likes = Column(Integer, default=0, nullable=False)
+    dislikes = Column(Integer, default=0, nullable=False)
+
 class User(Base):
     __tablename__ = "users"
 
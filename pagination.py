@@ -0,0 +1,27 @@
+# pagination.py
+import base64
+import json
+
+from fastapi import HTTPException
+
+
+def encode_cursor(*key):
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token: str, *types):
+    """Decode a cursor whose fields must be instances of ``types`` in order."""
+    # Cursors are opaque to clients; anything we can't decode is a bad request
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        key = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(key, list) or len(key) != len(types):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    for value, expected in zip(key, types):
+        # bool is an int subclass but never a valid key
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
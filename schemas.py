@@ -1,4 +1,6 @@
 # schemas.py
+from typing import List, Literal, Optional
+
 from pydantic import BaseModel
 
 class CardBase(BaseModel):
@@ -14,6 +16,30 @@ class Card(CardBase):
     class Config:
         orm_mode = True
 
+class CardPage(BaseModel):
+    items: List[Card]
+    next_cursor: Optional[str] = None
+
+class CardBulkUpdate(CardCreate):
+    id: int
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class SwipeCreate(BaseModel):
+    card_id: int
+    direction: Literal["left", "right"]
+
+class CardStats(BaseModel):
+    card_id: int
+    likes: int
+    dislikes: int
+
+    class Config:
+        orm_mode = True
+
 class UserBase(BaseModel):
     email: str
 
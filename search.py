@@ -0,0 +1,100 @@
+# search.py
+import re
+import sys
+
+from sqlalchemy import inspect, text
+
+from pagination import decode_cursor, encode_cursor
+
+# External-content FTS5 index over cards.title. The prefix indexes make
+# typeahead queries ("car*") index lookups instead of full term scans.
+# Shorter prefixes have no index and would match most of the table, so a
+# prefix term needs at least MIN_PREFIX characters.
+MIN_PREFIX = 2
+
+FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5(
+        title, content='cards', content_rowid='id', prefix='2 3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS cards_fts_ai AFTER INSERT ON cards BEGIN
+        INSERT INTO cards_fts(rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS cards_fts_ad AFTER DELETE ON cards BEGIN
+        INSERT INTO cards_fts(cards_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS cards_fts_au AFTER UPDATE OF id, title ON cards BEGIN
+        INSERT INTO cards_fts(cards_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO cards_fts(rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+]
+
+SEARCH_SQL = """
+    SELECT cards.id, cards.title, cards.image, cards_fts.rank AS rank
+    FROM cards_fts JOIN cards ON cards.id = cards_fts.rowid
+    WHERE cards_fts MATCH :match {after}
+    ORDER BY cards_fts.rank, cards.id
+    LIMIT :limit
+"""
+AFTER_SQL = "AND (cards_fts.rank > :rank OR (cards_fts.rank = :rank AND cards.id > :id))"
+
+
+def install(engine):
+    """Create the index and its triggers, backfilling it on first install."""
+    created = not inspect(engine).has_table("cards_fts")
+    with engine.begin() as conn:
+        for ddl in FTS_DDL:
+            conn.execute(text(ddl))
+        if created:
+            conn.execute(text("INSERT INTO cards_fts(cards_fts) VALUES ('rebuild')"))
+
+
+def rebuild(engine):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO cards_fts(cards_fts) VALUES ('rebuild')"))
+
+
+def match_expression(q: str):
+    # Quote every term so user input can't use FTS5 query syntax; the last
+    # term is a prefix so results update while the user is still typing.
+    # A single character only matches as a whole term: "b*" would rank
+    # nearly every row.
+    terms = re.findall(r"\w+", q)
+    if not terms:
+        return None
+    match = " ".join('"%s"' % term for term in terms)
+    if len(terms[-1]) >= MIN_PREFIX:
+        match += "*"
+    return match
+
+
+def search_query(match: str, limit: int, after: str = None):
+    """Build the ranked query for one page, starting after cursor ``after``."""
+    params = {"match": match, "limit": limit}
+    if not after:
+        return text(SEARCH_SQL.format(after="")), params
+    # Pages are keyed on (bm25 rank, id); a cursor that doesn't hold a
+    # number and an id is a 400, not a SQL error
+    params["rank"], params["id"] = decode_cursor(after, (int, float), int)
+    return text(SEARCH_SQL.format(after=AFTER_SQL)), params
+
+
+def next_cursor(row):
+    return encode_cursor(row.rank, row.id)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python search.py rebuild")
+    from models import engine
+
+    install(engine)
+    rebuild(engine)
+    print("cards_fts rebuilt")
@@ -0,0 +1,184 @@
+# swipes.py
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from fastapi import HTTPException
+from sqlalchemy import DateTime, bindparam, text
+
+from models import SessionLocal
+
+SWIPE_QUEUE_SIZE = int(os.environ.get("SWIPE_QUEUE_SIZE", 100000))
+SWIPE_BATCH_SIZE = int(os.environ.get("SWIPE_BATCH_SIZE", 2000))
+SWIPE_FLUSH_INTERVAL = float(os.environ.get("SWIPE_FLUSH_INTERVAL", 0.2))
+SWIPE_RETRY_AFTER = int(os.environ.get("SWIPE_RETRY_AFTER", 1))
+SWIPE_FLUSH_RETRIES = int(os.environ.get("SWIPE_FLUSH_RETRIES", 5))
+SWIPE_MAX_BATCH = int(os.environ.get("SWIPE_MAX_BATCH", 1000))
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Events for cards that don't exist (or were deleted before the flush) are
+# dropped here, inside the flush transaction, so they never create stats.
+INSERT_SWIPE = text("""
+    INSERT INTO swipes (card_id, direction, created_at)
+    SELECT :card_id, :direction, :created_at
+    WHERE EXISTS (SELECT 1 FROM cards WHERE id = :card_id)
+""").bindparams(bindparam("created_at", type_=DateTime))
+UPSERT_STATS = text("""
+    INSERT INTO card_stats (card_id, likes, dislikes)
+    SELECT :card_id, :likes, :dislikes
+    WHERE EXISTS (SELECT 1 FROM cards WHERE id = :card_id)
+    ON CONFLICT (card_id) DO UPDATE SET
+        likes = likes + excluded.likes, dislikes = dislikes + excluded.dislikes
+""")
+STATS_DDL = """
+    CREATE TRIGGER IF NOT EXISTS card_stats_ad AFTER DELETE ON cards BEGIN
+        DELETE FROM card_stats WHERE card_id = old.id;
+    END
+"""
+
+
+def install(engine):
+    with engine.begin() as conn:
+        conn.execute(text(STATS_DDL))
+        # Clear counters left behind for cards that no longer exist
+        conn.execute(text("DELETE FROM card_stats WHERE card_id NOT IN (SELECT id FROM cards)"))
+
+
+class SwipeWriter:
+    """Buffers swipe events in memory and group-commits them from one thread.
+
+    A batch is flushed when it reaches ``batch_size`` events or when
+    ``flush_interval`` seconds have passed since its first event. Each flush
+    appends the events and folds them into the per-card counters in one
+    transaction.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = SWIPE_QUEUE_SIZE,
+        batch_size: int = SWIPE_BATCH_SIZE,
+        flush_interval: float = SWIPE_FLUSH_INTERVAL,
+        max_batch: int = SWIPE_MAX_BATCH,
+    ):
+        self.batch_size = batch_size
+        # A request must fit in an empty queue, or retrying it can never work
+        self.max_batch = min(max_batch, maxsize) if maxsize > 0 else max_batch
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize)
+        self.thread = None
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.unknown = 0
+        self._put_lock = threading.Lock()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="swipe-writer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, events):
+        if len(events) > self.max_batch:
+            raise HTTPException(
+                status_code=413, detail=f"At most {self.max_batch} swipes per request"
+            )
+        # All or nothing, so a client can safely retry a rejected batch
+        with self._put_lock:
+            if self.queue.maxsize and self.queue.qsize() + len(events) > self.queue.maxsize:
+                self.rejected += len(events)
+                raise HTTPException(
+                    status_code=503,
+                    detail="Swipe queue is full, try again shortly",
+                    headers={"Retry-After": str(SWIPE_RETRY_AFTER)},
+                )
+            for event in events:
+                self.queue.put_nowait(event)
+            self.accepted += len(events)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            if batch[0] is _STOP:
+                return
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    event = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    stopping = True
+                    break
+                batch.append(event)
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch):
+        counts = Counter()
+        for event in batch:
+            counts[event["card_id"], event["direction"]] += 1
+        stats = {}
+        for (card_id, direction), n in counts.items():
+            row = stats.setdefault(card_id, {"card_id": card_id, "likes": 0, "dislikes": 0})
+            row["likes" if direction == "right" else "dislikes"] += n
+        # These events were already acknowledged with a 202, so a failed
+        # flush (lock or pool timeout) is retried with backoff before they
+        # are given up on. The queue keeps filling meanwhile, which pushes
+        # back on clients with 503s.
+        for attempt in range(SWIPE_FLUSH_RETRIES + 1):
+            try:
+                written = self._write(batch, list(stats.values()))
+            except Exception:
+                if attempt == SWIPE_FLUSH_RETRIES:
+                    self.failed += len(batch)
+                    logger.exception("Dropped %d swipe events", len(batch))
+                    return
+                logger.warning("Swipe flush failed, retrying", exc_info=True)
+                time.sleep(min(0.1 * 2 ** attempt, 5.0))
+            else:
+                self.written += written
+                self.unknown += len(batch) - written
+                self.batches += 1
+                return
+
+    def _write(self, batch, stats):
+        # Session.close() rolls back anything left uncommitted
+        with SessionLocal() as db:
+            written = db.execute(INSERT_SWIPE, batch).rowcount
+            db.execute(UPSERT_STATS, stats)
+            db.commit()
+        return written
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+            "unknown": self.unknown,
+        }
+
+
+swipe_writer = SwipeWriter()